@@ -4,13 +4,38 @@ import random
 from datetime import datetime, timedelta
 import hashlib
 import os
+import threading
 from collections import Counter
 
 DB_NAME = "inventory_system.db"
 
+# Every products column except image_data, which only the POS cards need
+PRODUCT_SUMMARY_COLUMNS = "id, name, category, price, stock, cost_price, sales_count, last_restock_date, expiry_date"
+
+_local = threading.local()
+
+class PooledConnection(sqlite3.Connection):
+    """
+    SQLite connection that is reused per thread. close() discards any
+    uncommitted work (same effect as closing) but keeps the handle open
+    for the next get_connection() call; release() really closes it.
+    """
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+
+    def release(self):
+        super().close()
+
 def get_connection():
-    """Returns a connection to the SQLite database."""
-    return sqlite3.connect(DB_NAME, check_same_thread=False, timeout=30)
+    """Returns this thread's pooled connection to the SQLite database."""
+    pooled = getattr(_local, 'pooled', None)
+    if pooled is None or pooled[0] != DB_NAME:
+        if pooled is not None:
+            pooled[1].release()
+        conn = sqlite3.connect(DB_NAME, check_same_thread=False, timeout=30, factory=PooledConnection)
+        pooled = _local.pooled = (DB_NAME, conn)
+    return pooled[1]
 
 def init_db():
     """Initializes the database, tables, and seeds default data."""
@@ -100,6 +125,14 @@ def init_db():
                   winner_mobile TEXT,
                   prize TEXT)''')
 
+    # Change counters for read-mostly tables; bumped by triggers on every write so caches can key on them
+    c.execute('''CREATE TABLE IF NOT EXISTS table_versions
+                 (name TEXT PRIMARY KEY, version INTEGER DEFAULT 0)''')
+    c.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES ('products', 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS products_version_{event.lower()} AFTER {event} ON products
+                      BEGIN UPDATE table_versions SET version = version + 1 WHERE name = 'products'; END''')
+
     defaults = {
         "store_name": "SmartInventory Enterprise",
         "upi_id": "merchant@okaxis",
@@ -134,6 +167,15 @@ def get_setting(key):
     conn.close()
     return res[0] if res else None
 
+def get_all_settings():
+    """Returns every system setting as a {key: value} dict in one query."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT key, value FROM system_settings")
+    res = dict(c.fetchall())
+    conn.close()
+    return res
+
 def set_setting(key, value):
     conn = get_connection()
     c = conn.cursor()
@@ -178,7 +220,7 @@ def process_sale_transaction(cart_items, total, mode, operator, pos_id, customer
             c.execute("UPDATE products SET stock = stock - ?, sales_count = sales_count + ? WHERE id=?", (qty, qty, pid))
         
         # 3. Create Sales Record
-        items_data_str = ",".join([str(pid) for pid in item_ids])
+        items_data_str = ",".join(map(str, item_ids))
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
         c.execute("""INSERT INTO sales (timestamp, total_amount, items_data, integrity_hash, 
@@ -435,6 +477,22 @@ def get_all_products():
     conn.close()
     return df
 
+def get_products_signature():
+    """Monotonic version of the products table; any insert, update or delete bumps it."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT version FROM table_versions WHERE name = 'products'")
+    res = c.fetchone()
+    conn.close()
+    return res[0] if res else 0
+
+def get_products_summary():
+    """Products without the image BLOB, for tables and analytics."""
+    conn = get_connection()
+    df = pd.read_sql(f"SELECT {PRODUCT_SUMMARY_COLUMNS} FROM products", conn)
+    conn.close()
+    return df
+
 def get_product_by_id(p_id):
     conn = get_connection()
     c = conn.cursor()
@@ -462,6 +520,45 @@ def get_sales_data():
     conn.close()
     return df
 
+def get_sales_range(start_date=None, end_date=None,
+                    columns="id, timestamp, total_amount, items_data, payment_mode"):
+    """
+    Non-cancelled sales, optionally bounded by timestamp (start inclusive,
+    end exclusive), reading only the columns analytics needs. Timestamps
+    are stored as ISO strings, so the bounds compare lexically in SQL.
+    """
+    query = f"SELECT {columns} FROM sales WHERE status != 'Cancelled'"
+    params = []
+    if start_date:
+        query += " AND timestamp >= ?"
+        params.append(str(start_date))
+    if end_date:
+        query += " AND timestamp < ?"
+        params.append(str(end_date))
+    
+    conn = get_connection()
+    df = pd.read_sql(query, conn, params=params, parse_dates=['timestamp'])
+    conn.close()
+    return df
+
+def get_sales_date_bounds():
+    """Returns (first, last) timestamp strings of non-cancelled sales, or (None, None)."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT MIN(timestamp), MAX(timestamp) FROM sales WHERE status != 'Cancelled'")
+    res = c.fetchone()
+    conn.close()
+    return res
+
+def get_sales_signature():
+    """Cheap change marker for non-cancelled sales (new sale or a cancellation)."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM sales WHERE status != 'Cancelled'")
+    res = c.fetchone()
+    conn.close()
+    return res
+
 def seed_advanced_demo_data():
     """
     Generates realistic demo data DIRECTLY in the database.
@@ -664,6 +761,15 @@ def get_cancellation_audit_log():
     conn.close()
     return df
 
+def get_cancellation_signature():
+    """Cheap change marker for the cancellation audit log."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT COUNT(*), MAX(cancellation_timestamp) FROM sales WHERE status = 'Cancelled'")
+    res = c.fetchone()
+    conn.close()
+    return res
+
 def get_category_performance():
     conn = get_connection()
     # Using items_data as per schema
@@ -20,8 +20,9 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-if 'theme' not in st.session_state:
-    st.session_state['theme'] = 'dark'
+# Session defaults read on every rerun
+for _key, _default in (('theme', 'dark'), ('user', None), ('role', None), ('full_name', '')):
+    st.session_state.setdefault(_key, _default)
 
 styles.load_css(st.session_state['theme'])
 
@@ -30,10 +31,7 @@ if 'initialized' not in st.session_state:
     db.init_db()
     db.seed_advanced_demo_data() 
     st.session_state['initialized'] = True
-    st.session_state['cart'] = []
-    st.session_state['user'] = None
-    st.session_state['role'] = None
-    st.session_state['full_name'] = None
+    st.session_state['cart'] = {} # {product_id: {'item': record, 'qty': n}}
     st.session_state['pos_id'] = "POS-1" # Default single terminal
     st.session_state['checkout_stage'] = 'cart'
     st.session_state['txn_start_time'] = None
@@ -49,24 +47,51 @@ if 'initialized' not in st.session_state:
     # Session State for Forms
     st.session_state['clear_inventory_form'] = False
 
+# --- HELPER FUNCTIONS ---
+@st.cache_data(ttl=300, show_spinner=False)
+def _all_settings():
+    # One SELECT per TTL; typed once here so render paths never re-parse the stored strings
+    raw = db.get_all_settings()
+    return {
+        "currency_symbol": raw.get("currency_symbol"),
+        "store_name": raw.get("store_name"),
+        "upi_id": raw.get("upi_id"),
+        "tax_rate": float(raw.get("tax_rate") or 0),
+        "gst_enabled": raw.get("gst_enabled") == 'True',
+    }
+
 # Load Configs
-currency = db.get_setting("currency_symbol")
-store_name = db.get_setting("store_name")
+currency = _all_settings()["currency_symbol"]
+store_name = _all_settings()["store_name"]
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def _load_products_df(token, images=True):
+    if not images:
+        return db.get_products_summary()
+    df = db.get_all_products()
+    # Encode product photos once per catalog version instead of on every card render
+    df['image_b64'] = df.pop('image_data').map(styles.encode_image)
+    return df
+
+def get_products_df(images=False):
+    # Single cached entry point for every view; a new products signature means a fresh load
+    return _load_products_df(db.get_products_signature(), images)
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def get_trie(token):
+    # Process-wide and shared across sessions; a resource, so it is never pickled
+    df = _load_products_df(token)
+    return utils.PrefixIndex(df['name'].tolist(), df.to_dict('records'))
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def _product_names_lower(token):
+    # Lowercased once per catalog version for the vectorized Legacy search
+    return _load_products_df(token)['name'].str.lower().to_numpy(dtype=str)
 
-# --- HELPER FUNCTIONS ---
 def refresh_trie():
-    conn = db.get_connection()
-    df = pd.read_sql("SELECT * FROM products", conn)
-    conn.close()
-    t = utils.Trie()
-    for _, row in df.iterrows():
-        t.insert(row['name'], row.to_dict())
-    return t, df
-
-if 'product_trie' not in st.session_state:
-    trie, df_p = refresh_trie()
-    st.session_state['product_trie'] = trie
-    st.session_state['df_products'] = df_p
+    # Rebuilt only when the products version moves (any insert, update or delete)
+    token = db.get_products_signature()
+    return get_trie(token), _load_products_df(token), _product_names_lower(token)
 
 # --- AUTHENTICATION MODULE ---
 def login_view():
@@ -143,6 +168,34 @@ def logout_user():
 
 # --- MODULES ---
 
+# Button callbacks: state is updated before the rerun, so no second st.rerun() pass
+def _add_to_cart(item):
+    entry = st.session_state['cart'].setdefault(item['id'], {'item': item, 'qty': 0})
+    entry['qty'] += 1
+    st.toast(f"Added {item['name']}")
+
+def _shift_page(step, n_results, page_size):
+    if step < 0:
+        st.session_state.page = max(0, st.session_state.page + step)
+    elif (st.session_state.page + step) * page_size < n_results:
+        st.session_state.page += step
+
+def _reset_page():
+    # A new query or search mode starts from the first page of its results
+    st.session_state.page = 0
+
+def _select_payment_mode(mode):
+    st.session_state['selected_payment_mode'] = mode
+    st.session_state['checkout_stage'] = 'payment_process'
+    if mode == 'UPI':
+        st.session_state['qr_expiry'] = None
+
+def _start_new_sale():
+    st.session_state['cart'] = {}
+    st.session_state['current_customer'] = None
+    st.session_state['checkout_stage'] = 'cart'
+    st.session_state['applied_coupon'] = None
+
 def pos_interface():
     st.markdown("<div class='card-container'>", unsafe_allow_html=True)
     c1, c2, c3 = st.columns([3, 1, 1])
@@ -153,7 +206,7 @@ def pos_interface():
         st.markdown(f"<div style='text-align:right'><b>{st.session_state['full_name']}</b><br><span style='font-size:0.8em;opacity:0.7'>Operator</span></div>", unsafe_allow_html=True)
     st.markdown("</div>", unsafe_allow_html=True)
         
-    trie, df_p = refresh_trie()
+    trie, df_p, names_lower = refresh_trie()
     
     # --- STATE MACHINE: CART VIEW ---
     if st.session_state['checkout_stage'] == 'cart':
@@ -215,64 +268,63 @@ def pos_interface():
             st.markdown("##### ⌨️ Manual Search")
             c_search, c_algo = st.columns([3, 1])
             with c_search:
-                query = st.text_input("Search Product", key="pos_search")
+                query = st.text_input("Search Product", key="pos_search", on_change=_reset_page)
             with c_algo:
                 # Algo text simplified for user
-                algo = st.selectbox("Search Mode", ["Standard", "Legacy"])
+                algo = st.selectbox("Search Mode", ["Standard", "Legacy"], on_change=_reset_page)
 
         left_panel, right_panel = st.columns([2, 1])
 
         with left_panel:
-            results = []
-            if query:
-                if algo == "Standard":
-                    results = trie.search_prefix(query)
-                else:
-                    results = df_p[df_p['name'].str.contains(query, case=False)].to_dict('records')
+            # Trie hits are already a short list; DataFrame results stay as frames until paginated
+            if query and algo == "Standard":
+                results = trie.search_prefix(query)
+            elif query:
+                mask = np.char.find(names_lower, query.lower()) >= 0
+                results = df_p[mask]
             else:
-                results = df_p.to_dict('records')
+                results = df_p
             
             page_size = 6
             if 'page' not in st.session_state: st.session_state.page = 0
             start_idx = st.session_state.page * page_size
             end_idx = start_idx + page_size
-            visible_items = results[start_idx:end_idx]
+            if isinstance(results, pd.DataFrame):
+                visible_items = results.iloc[start_idx:end_idx].to_dict('records')
+            else:
+                visible_items = results[start_idx:end_idx]
             
+            cart = st.session_state['cart']
             cols = st.columns(3)
             for i, item in enumerate(visible_items):
                 with cols[i % 3]:
                     st.markdown(styles.product_card_html(
-                        item['name'], item['price'], item['stock'], item['category'], currency, item.get('image_data')
+                        item['name'], item['price'], item['stock'], item['category'], currency, item.get('image_b64')
                     ), unsafe_allow_html=True)
                     
-                    cart_qty = sum(1 for x in st.session_state['cart'] if x['id'] == item['id'])
+                    cart_qty = cart[item['id']]['qty'] if item['id'] in cart else 0
                     
                     if item['stock'] > cart_qty:
-                        if st.button("Add ➕", key=f"add_{item['id']}"):
-                            st.session_state['cart'].append(item)
-                            st.toast(f"Added {item['name']}")
-                            st.rerun()
+                        st.button("Add ➕", key=f"add_{item['id']}", on_click=_add_to_cart, args=(item,))
                     else:
                         st.button("🚫 Out of Stock", disabled=True, key=f"no_{item['id']}")
             
             c_prev, c_next = st.columns([1,1])
-            if c_prev.button("Previous") and st.session_state.page > 0:
-                st.session_state.page -= 1
-                st.rerun()
-            if c_next.button("Next") and end_idx < len(results):
-                st.session_state.page += 1
-                st.rerun()
+            c_prev.button("Previous", on_click=_shift_page, args=(-1, len(results), page_size))
+            c_next.button("Next", on_click=_shift_page, args=(1, len(results), page_size))
 
         with right_panel:
             st.markdown("<div class='card-container'>", unsafe_allow_html=True)
             st.markdown("### 🛍️ Cart Summary")
             if st.session_state['cart']:
-                cart_df = pd.DataFrame(st.session_state['cart'])
-                summary = cart_df.groupby('name').agg({'price': 'first', 'id': 'count'}).rename(columns={'id': 'Qty'})
-                summary['Total'] = summary['price'] * summary['Qty']
-                st.dataframe(summary[['Qty', 'Total']], use_container_width=True)
+                # Cart is a handful of lines; aggregate in plain Python rather than pandas
+                summary = [
+                    {"name": v['item']['name'], "Qty": v['qty'], "Total": v['qty'] * v['item']['price']}
+                    for v in st.session_state['cart'].values()
+                ]
+                st.dataframe(summary, use_container_width=True, hide_index=True)
                 
-                raw_total = summary['Total'].sum()
+                raw_total = sum(row['Total'] for row in summary)
                 
                 # No Loyalty, No Coupons
                 discount = 0
@@ -281,10 +333,10 @@ def pos_interface():
                 # Removed Points Redemption Logic
                 total_after_disc = max(0, raw_total - discount - fest_disc)
                 
-                gst_enabled = db.get_setting("gst_enabled") == 'True'
+                settings = _all_settings()
                 tax_amount = 0.0
-                if gst_enabled:
-                    tax_rate = float(db.get_setting("tax_rate"))
+                if settings["gst_enabled"]:
+                    tax_rate = settings["tax_rate"]
                     tax_amount = total_after_disc * (tax_rate / 100)
                     st.write(f"GST ({tax_rate}%): {currency}{tax_amount:,.2f}")
                 
@@ -303,9 +355,7 @@ def pos_interface():
                 c_clear, c_pay = st.columns([1, 2])
                 
                 with c_clear:
-                    if st.button("🗑️ Clear", use_container_width=True):
-                        st.session_state['cart'] = []
-                        st.rerun()
+                    st.button("🗑️ Clear", use_container_width=True, on_click=lambda: st.session_state.update({'cart': {}}))
                 
                 with c_pay:
                     if st.button("💳 Pay", type="primary", use_container_width=True):
@@ -332,21 +382,11 @@ def pos_interface():
         
         c1, c2, c3 = st.columns(3)
         with c1:
-            if st.button("💵 Cash", use_container_width=True):
-                st.session_state['selected_payment_mode'] = 'Cash'
-                st.session_state['checkout_stage'] = 'payment_process'
-                st.rerun()
+            st.button("💵 Cash", use_container_width=True, on_click=_select_payment_mode, args=('Cash',))
         with c2:
-            if st.button("📱 UPI", use_container_width=True):
-                st.session_state['selected_payment_mode'] = 'UPI'
-                st.session_state['checkout_stage'] = 'payment_process'
-                st.session_state['qr_expiry'] = None 
-                st.rerun()
+            st.button("📱 UPI", use_container_width=True, on_click=_select_payment_mode, args=('UPI',))
         with c3:
-            if st.button("💳 Card", use_container_width=True):
-                st.session_state['selected_payment_mode'] = 'Card'
-                st.session_state['checkout_stage'] = 'payment_process'
-                st.rerun()
+            st.button("💳 Card", use_container_width=True, on_click=_select_payment_mode, args=('Card',))
         st.markdown("</div>", unsafe_allow_html=True)
 
     elif st.session_state['checkout_stage'] == 'payment_process':
@@ -370,8 +410,8 @@ def pos_interface():
             
             c_qr, c_info = st.columns([1, 1])
             with c_qr:
-                upi_id = db.get_setting("upi_id")
-                qr_img = utils.generate_upi_qr(upi_id, store_name, total, "Bill Payment")
+                upi_id = _all_settings()["upi_id"]
+                qr_img = _upi_qr(upi_id, store_name, round(total * 100), "Bill Payment")
                 st.image(qr_img, width=250, caption=f"Scan to Pay: {currency}{total:.2f}")
             
             with c_info:
@@ -422,15 +462,14 @@ def pos_interface():
                 st.download_button("📄 Download Receipt PDF", st.session_state['last_receipt'], "receipt.pdf", "application/pdf", use_container_width=True)
         
         with c_rec2:
-            if st.button("🛒 Start New Sale", type="primary", use_container_width=True):
-                st.session_state['cart'] = []
-                st.session_state['current_customer'] = None
-                st.session_state['checkout_stage'] = 'cart'
-                st.session_state['applied_coupon'] = None
-                # Removed points_to_redeem reset
-                st.rerun()
+            st.button("🛒 Start New Sale", type="primary", use_container_width=True, on_click=_start_new_sale)
         st.markdown("</div>", unsafe_allow_html=True)
 
+@st.cache_data(max_entries=256, show_spinner=False)
+def _upi_qr(upi_id, store, amount_cents, note):
+    # Integer cents keep the cache key exact; same bill amount reuses the rendered PNG
+    return utils.generate_upi_qr(upi_id, store, amount_cents / 100, note)
+
 def finalize_sale(total, mode):
     calc = st.session_state['final_calc']
     txn_time = utils.get_system_time().strftime("%Y-%m-%d %H:%M:%S")
@@ -446,10 +485,13 @@ def finalize_sale(total, mode):
     # Internal logic removed from hash generation conceptually, just passing placeholders
     integrity_hash = "NA"
     
+    # DB and receipt expect one record per unit sold
+    cart_items = [v['item'] for v in st.session_state['cart'].values() for _ in range(v['qty'])]
+    
     try:
         # Calls db.process_sale_transaction without coupon args and without points
         sale_id = db.process_sale_transaction(
-            st.session_state['cart'],
+            cart_items,
             total,
             mode,
             operator,
@@ -464,7 +506,7 @@ def finalize_sale(total, mode):
         
         tax_info = {"tax_amount": calc['tax'], "tax_percent": 18}
         
-        pdf = utils.generate_receipt_pdf(store_name, sale_id, txn_time, st.session_state['cart'], total, operator, mode, st.session_state['pos_id'], customer, tax_info, new_coupon=None)
+        pdf = utils.generate_receipt_pdf(store_name, sale_id, txn_time, cart_items, total, operator, mode, st.session_state['pos_id'], customer, tax_info, new_coupon=None)
         
         st.session_state['last_receipt'] = pdf
         st.session_state['checkout_stage'] = 'receipt'
@@ -478,9 +520,7 @@ def inventory_manager():
     # Tab 1 renamed from View & Edit to View. Added Restock Product tab.
     tab_view, tab_add, tab_restock = st.tabs(["View Stock", "Add New Product", "Restock Product"])
     
-    conn = db.get_connection()
-    df = pd.read_sql("SELECT * FROM products", conn)
-    conn.close()
+    df = get_products_df()
     
     with tab_view:
         st.markdown("<div class='card-container'>", unsafe_allow_html=True)
@@ -552,6 +592,8 @@ def inventory_manager():
                 else:
                     img_bytes = img_file.getvalue() if img_file else None
                     if db.add_product(n, c, p, s, cp, None, img_bytes):
+                        _load_products_df.clear()
+                        get_trie.clear()
                         st.success(f"Product '{n}' Added Successfully!")
                         time.sleep(1)
                         st.rerun()
@@ -579,61 +621,56 @@ def inventory_manager():
                     else:
                         pid = prod_map[sel_p]
                         db.restock_product(pid, add_qty)
+                        _load_products_df.clear()
+                        get_trie.clear()
                         st.success("Product restocked successfully")
                         time.sleep(1)
                         st.rerun()
         st.markdown("</div>", unsafe_allow_html=True)
 
+@st.cache_data(ttl=300, max_entries=8, show_spinner=False)
+def _analytics_frames(start_d, end_d, sales_token, products_token):
+    # Keyed on the date window and the cheap table signatures, so reruns skip the reload and item expansion
+    # Fetch Data - Strict Rule: Cancelled orders excluded from analytics (filtered in SQL)
+    df_sales = db.get_sales_range(start_d, end_d + timedelta(days=1))
+    if df_sales.empty:
+        return df_sales, pd.DataFrame()
+
+    # Timestamps arrive parsed from SQL
+    df_sales['date'] = df_sales['timestamp'].dt.date
+    df_sales['hour'] = df_sales['timestamp'].dt.hour
+    df_sales['day_name'] = df_sales['timestamp'].dt.day_name()
+
+    # Detailed Item Level Data: one row per sold unit, priced by joining against the catalog
+    products = _load_products_df(products_token, images=False)[['id', 'name', 'category', 'price', 'cost_price']]
+    sold = utils.sold_item_ids(df_sales).rename('product_id').to_frame().join(df_sales[['id', 'timestamp']])
+    df_items = sold.merge(products, left_on='product_id', right_on='id', how='inner', suffixes=('', '_product'))
+    df_items = df_items.rename(columns={'id': 'sale_id', 'name': 'product_name', 'price': 'selling_price'})
+    df_items['profit'] = df_items['selling_price'] - df_items['cost_price']
+    
+    return df_sales, df_items[['sale_id', 'timestamp', 'product_name', 'category', 'selling_price', 'cost_price', 'profit']]
+
 def analytics_dashboard():
     st.title("📊 Business Intelligence Dashboard")
     st.markdown("---")
 
-    # Fetch Data
-    df_sales = db.get_sales_data()
-    conn = db.get_connection()
-    df_products = pd.read_sql("SELECT * FROM products", conn)
-    conn.close()
-
-    # Data Preprocessing
-    if df_sales.empty:
+    first_ts, _ = db.get_sales_date_bounds()
+    if not first_ts:
         st.warning("No sales data available to generate analytics.")
         return
+    
+    today = datetime.now().date()
+    first_day = min(datetime.strptime(first_ts[:10], "%Y-%m-%d").date(), today)
+    date_range = st.date_input("Date Range", value=(first_day, today))
+    start_d, end_d = (date_range[0], date_range[-1]) if date_range else (first_day, today)
 
-    # Filter Cancelled - Strict Rule: Cancelled orders excluded from analytics
-    if 'status' in df_sales.columns:
-        df_sales = df_sales[df_sales['status'] != 'Cancelled']
-
-    # Convert timestamps
-    df_sales['timestamp'] = pd.to_datetime(df_sales['timestamp'])
-    df_sales['date'] = df_sales['timestamp'].dt.date
-    df_sales['hour'] = df_sales['timestamp'].dt.hour
-    df_sales['day_name'] = df_sales['timestamp'].dt.day_name()
+    products_token = db.get_products_signature()
+    df_products = _load_products_df(products_token, images=False)
+    df_sales, df_items = _analytics_frames(start_d, end_d, db.get_sales_signature(), products_token)
 
-    # Detailed Item Level Data
-    items_list = []
-    prod_dict = df_products.set_index('id').to_dict('index')
-
-    for _, row in df_sales.iterrows():
-        try:
-            # Replaced JSON loads with CSV string split
-            if row['items_data']:
-                ids = [int(x) for x in str(row['items_data']).split(',') if x.strip()]
-                for pid in ids:
-                    if pid in prod_dict:
-                        p = prod_dict[pid]
-                        items_list.append({
-                            'sale_id': row['id'],
-                            'timestamp': row['timestamp'],
-                            'product_name': p['name'],
-                            'category': p['category'],
-                            'selling_price': p['price'],
-                            'cost_price': p['cost_price'],
-                            'profit': p['price'] - p['cost_price']
-                        })
-        except:
-            continue
-    
-    df_items = pd.DataFrame(items_list)
+    if df_sales.empty:
+        st.warning("No sales data available to generate analytics.")
+        return
 
     if df_items.empty:
         st.warning("Sales data found, but unable to process item details.")
@@ -760,16 +797,23 @@ def analytics_dashboard():
             
     # Optional Advanced: AOV
     st.markdown("---")
-    avg_order_value = total_revenue / len(df_sales)
+    n_orders = len(df_sales.index)
+    avg_order_value = total_revenue / n_orders if n_orders else 0.0
     st.metric("🛒 Average Order Value (AOV)", f"{currency}{avg_order_value:,.2f}")
 
 def marketing_hub():
     st.title("🚀 Retail Marketing Hub")
-    
+
     st.markdown("<div class='card-container'>", unsafe_allow_html=True)
     st.subheader("🎲 Lucky Draw System")
     st.caption("Select winner from eligible customers based on sales history.")
-    
+
+    _lucky_draw()
+    st.markdown("</div>", unsafe_allow_html=True)
+
+@st.fragment
+def _lucky_draw():
+    # Runs as a fragment so "Pick Winner" only reruns this section
     c1, c2, c3 = st.columns(3)
     ld_days = c1.number_input("Sales Lookback (Days)", value=7)
     ld_min = c2.number_input("Minimum Spend", value=1000)
@@ -785,7 +829,18 @@ def marketing_hub():
             
     st.markdown("#### Past Winners")
     st.dataframe(db.get_lucky_draw_history(), use_container_width=True)
-    st.markdown("</div>", unsafe_allow_html=True)
+
+# ID, Date, Amount, Method, Operator, Cust Name, Cust Email, Cust Mobile, Status
+ORDER_DISPLAY_COLUMNS = {
+    'id': "Order ID", 'timestamp': "Date", 'total_amount': "Total",
+    'payment_mode': "Method", 'operator': "Cashier", 'customer_name': "Customer Name",
+    'customer_email': "Customer Email", 'customer_mobile': "Mobile", 'status': "Status"
+}
+
+@st.cache_data(ttl="5m", show_spinner=False)
+def _cancels_html(sig):
+    # Audit log changes rarely; render it once per (count, latest cancellation) signature
+    return db.get_cancellation_audit_log().to_html(index=False)
 
 def orders_page():
     st.title("📜 Order & Payment Details")
@@ -797,27 +852,34 @@ def orders_page():
         st.subheader("🔍 Search & Filters")
         c1, c2 = st.columns(2)
         f_id = c1.number_input("Order ID", min_value=0, value=0)
-        f_op = c2.text_input("Customer Mobile")
+        f_op = c2.text_input("Customer Mobile", key="cm_q")
         
         filters = {}
         if f_id > 0: filters['bill_no'] = f_id
         
         # Updated: Removed POS ID logic, added Customer columns in display
-        txns = db.get_transaction_history(filters)
+        # Debounce: reruns within 300 ms of the last fetch for the same order filter reuse it;
+        # anything older is re-queried so other terminals' sales and cancellations show up
+        recent = time.time() - st.session_state.get('cm_q_ts', 0) < 0.3
+        cached_txns = st.session_state.get('orders_txns')
+        if cached_txns is not None and st.session_state.get('cm_q_last') == f_id and recent:
+            txns = cached_txns
+        else:
+            txns = db.get_transaction_history(filters)
+            st.session_state['orders_txns'] = txns
+            st.session_state['cm_q_last'] = f_id
+            st.session_state['cm_q_ts'] = time.time()
         
         # If the user searched by Mobile, filter client-side if the query doesn't handle it fully 
         if f_op and not txns.empty:
-            txns = txns[txns['customer_mobile'].astype(str).str.contains(f_op, na=False)]
+            # Vectorized substring match over a fixed-width unicode array (partial numbers still match)
+            mobiles = txns['customer_mobile'].fillna('').to_numpy(dtype=str)
+            txns = txns[np.char.find(mobiles, f_op) >= 0]
         
         # Clean Columns for Display
         if not txns.empty:
-            # Select columns to show
-            # ID, Date, Amount, Method, Operator, Cust Name, Cust Email, Cust Mobile, Status
-            display_df = txns[['id', 'timestamp', 'total_amount', 'payment_mode', 'operator', 
-                            'customer_name', 'customer_email', 'customer_mobile', 'status']]
-            display_df.columns = ["Order ID", "Date", "Total", "Method", "Cashier", 
-                                "Customer Name", "Customer Email", "Mobile", "Status"]
-            st.dataframe(display_df, use_container_width=True)
+            # Built from the fresh rows every run so status and customer edits always show
+            st.dataframe(txns[list(ORDER_DISPLAY_COLUMNS)].rename(columns=ORDER_DISPLAY_COLUMNS), use_container_width=True)
         else:
             st.info("No records found.")
         
@@ -834,6 +896,9 @@ def orders_page():
                 else:
                     success, msg = db.cancel_sale_transaction(c_oid, st.session_state['user'], st.session_state['role'], c_reason, c_pass)
                     if success:
+                        st.session_state.pop('orders_txns', None) # Status changed, re-query history
+                        _load_products_df.clear() # Stock was restored
+                        get_trie.clear()
                         st.success(msg)
                         time.sleep(1)
                         st.rerun()
@@ -842,8 +907,7 @@ def orders_page():
         
         st.markdown("---")
         st.subheader("🚫 Cancelled Orders Audit")
-        cancels = db.get_cancellation_audit_log()
-        st.dataframe(cancels, use_container_width=True)
+        st.markdown(_cancels_html(db.get_cancellation_signature()), unsafe_allow_html=True)
         st.markdown("</div>", unsafe_allow_html=True)
         
     with tab_customers:
@@ -853,9 +917,7 @@ def orders_page():
         # Fetch all customers
         customers = db.get_all_customers()
         sales_data = db.get_sales_data()
-        conn = db.get_connection()
-        products = pd.read_sql("SELECT * FROM products", conn)
-        conn.close()
+        products = get_products_df()
         
         if not customers.empty and not sales_data.empty:
             # Calculate metrics per customer
@@ -921,12 +983,13 @@ def admin_panel():
     st.title("⚙️ Admin Settings")
     st.markdown("<div class='card-container'>", unsafe_allow_html=True)
     
+    settings = _all_settings()
     with st.form("settings_form"):
-        s_name = st.text_input("Store Name", value=db.get_setting("store_name"))
-        s_upi = st.text_input("UPI ID", value=db.get_setting("upi_id"))
+        s_name = st.text_input("Store Name", value=settings["store_name"])
+        s_upi = st.text_input("UPI ID", value=settings["upi_id"])
         col_s1, col_s2 = st.columns(2)
-        with col_s1: s_tax = st.number_input("GST %", value=float(db.get_setting("tax_rate")))
-        with col_s2: s_gst_enable = st.checkbox("Enable GST", value=(db.get_setting("gst_enabled") == 'True'))
+        with col_s1: s_tax = st.number_input("GST %", value=settings["tax_rate"])
+        with col_s2: s_gst_enable = st.checkbox("Enable GST", value=settings["gst_enabled"])
         
         if st.form_submit_button("Save Settings"):
             if not s_name.strip() or not s_upi.strip(): # Added validation
@@ -936,6 +999,7 @@ def admin_panel():
                 db.set_setting("upi_id", s_upi)
                 db.set_setting("tax_rate", str(s_tax))
                 db.set_setting("gst_enabled", str(s_gst_enable))
+                _all_settings.clear()
                 db.log_activity(st.session_state['user'], "Settings Update", "Modified")
                 st.success("Settings Saved!")
                 time.sleep(1)
@@ -1014,24 +1078,35 @@ def user_profile_page():
     st.markdown("</div>", unsafe_allow_html=True)
 
 # --- MAIN CONTROLLER ---
+_SIDEBAR_HTML = """
+<div style="padding: 15px; background: rgba(255,255,255,0.05); border-radius: 12px; margin-bottom: 20px; border: 1px solid rgba(255,255,255,0.1);">
+    <div style="font-size: 0.8rem; opacity: 0.7; letter-spacing: 1px;">CURRENT USER</div>
+    <div style="font-weight: 600; font-size: 1.1rem; margin-top: 5px;">{user}</div>
+    <div style="font-size: 0.85rem; color: #6366f1; margin-top: 2px;">{role}</div>
+</div>
+"""
+
+PAGES = {
+    "POS Terminal": pos_interface,
+    "Retail Marketing Hub": marketing_hub,
+    "Inventory": inventory_manager,
+    "Orders": orders_page,
+    "Analytics": analytics_dashboard,
+    "Admin Settings": admin_panel,
+    "My Profile": user_profile_page,
+}
+
 def main():
-    if not st.session_state.get('user'):
+    user = st.session_state['user']
+    role = st.session_state['role']
+    if not user:
         login_view()
     else:
         with st.sidebar:
-            st.markdown(f"""
-            <div style="padding: 15px; background: rgba(255,255,255,0.05); border-radius: 12px; margin-bottom: 20px; border: 1px solid rgba(255,255,255,0.1);">
-                <div style="font-size: 0.8rem; opacity: 0.7; letter-spacing: 1px;">CURRENT USER</div>
-                <div style="font-weight: 600; font-size: 1.1rem; margin-top: 5px;">{st.session_state['user']}</div>
-                <div style="font-size: 0.85rem; color: #6366f1; margin-top: 2px;">{st.session_state['role']}</div>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            role = st.session_state['role']
+            st.markdown(_SIDEBAR_HTML.format(user=user, role=role), unsafe_allow_html=True)
             
-            nav_opts = []
             if role == "Admin": 
-                nav_opts = ["Retail Marketing Hub", "Inventory", "Orders", "Analytics", "Admin Settings", "My Profile"]
+                nav_opts = [p for p in PAGES if p != "POS Terminal"]
             else:
                 nav_opts = ["POS Terminal", "My Profile"]
             
@@ -1040,13 +1115,7 @@ def main():
             st.markdown("---")
             if st.button("🚪 Log Out", use_container_width=True): logout_user()
         
-        if choice == "POS Terminal": pos_interface()
-        elif choice == "Inventory": inventory_manager()
-        elif choice == "Analytics": analytics_dashboard()
-        elif choice == "Retail Marketing Hub": marketing_hub()
-        elif choice == "Orders": orders_page()
-        elif choice == "Admin Settings": admin_panel()
-        elif choice == "My Profile": user_profile_page()
+        PAGES.get(choice, lambda: None)()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,20 @@
+from fpdf import FPDF
+
+class PDFReceipt(FPDF):
+    def __init__(self, store_name):
+        super().__init__()
+        self.store_name = store_name
+        # Logo logic removed
+
+    def header(self):
+        # Header Logo logic removed
+        self.set_font('Arial', 'B', 15)
+        self.cell(0, 10, self.store_name, 0, 1, 'C')
+        self.set_font('Arial', '', 9)
+        self.cell(0, 5, 'Professional Retail Invoice', 0, 1, 'C')
+        self.ln(5)
+
+    def footer(self):
+        self.set_y(-15)
+        self.set_font('Arial', 'I', 8)
+        self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
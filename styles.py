@@ -1,47 +1,50 @@
 import streamlit as st
 import base64
 
-def load_css(theme="dark"):
-    # Define Color Palettes
-    if theme == "dark":
-        primary_bg = "#0f172a" # Slate 900
-        secondary_bg = "#1e293b" # Slate 800
-        text_color = "#f8fafc" # Slate 50
-        accent_color = "#6366f1" # Indigo 500
-        success_color = "#10b981" # Emerald 500
-        warning_color = "#f59e0b" # Amber 500
-        error_color = "#ef4444" # Red 500
-        card_bg = "rgba(30, 41, 59, 0.7)"
-        border_color = "rgba(255, 255, 255, 0.1)"
-        shadow = "0 4px 6px -1px rgba(0, 0, 0, 0.3)"
-        muted_text = "#94a3b8"
-    elif theme == "adaptive":
-        # Professional Adaptive Theme
-        primary_bg = "#f3f4f6" # Gray 100
-        secondary_bg = "#ffffff" # White
-        text_color = "#111827" # Gray 900
-        accent_color = "#2563eb" # Blue 600
-        success_color = "#059669" # Emerald 600
-        warning_color = "#d97706" # Amber 600
-        error_color = "#dc2626" # Red 600
-        card_bg = "rgba(255, 255, 255, 0.95)"
-        border_color = "rgba(0, 0, 0, 0.1)"
-        shadow = "0 4px 6px -1px rgba(0, 0, 0, 0.1), 0 2px 4px -1px rgba(0, 0, 0, 0.06)"
-        muted_text = "#4b5563"
-    else: # light (Classic)
-        primary_bg = "#f8fafc" # Slate 50
-        secondary_bg = "#ffffff" # White
-        text_color = "#0f172a" # Slate 900
-        accent_color = "#4f46e5" # Indigo 600
-        success_color = "#059669" # Emerald 600
-        warning_color = "#d97706" # Amber 600
-        error_color = "#dc2626" # Red 600
-        card_bg = "rgba(255, 255, 255, 0.9)"
-        border_color = "rgba(0, 0, 0, 0.08)"
-        shadow = "0 10px 15px -3px rgba(0, 0, 0, 0.05)"
-        muted_text = "#64748b"
+# Color palettes per theme, substituted into _CSS_TEMPLATE
+_PALETTES = {
+    "dark": {
+        "primary_bg": "#0f172a", # Slate 900
+        "secondary_bg": "#1e293b", # Slate 800
+        "text_color": "#f8fafc", # Slate 50
+        "accent_color": "#6366f1", # Indigo 500
+        "success_color": "#10b981", # Emerald 500
+        "warning_color": "#f59e0b", # Amber 500
+        "error_color": "#ef4444", # Red 500
+        "card_bg": "rgba(30, 41, 59, 0.7)",
+        "border_color": "rgba(255, 255, 255, 0.1)",
+        "shadow": "0 4px 6px -1px rgba(0, 0, 0, 0.3)",
+        "muted_text": "#94a3b8",
+    },
+    "adaptive": { # Professional Adaptive Theme
+        "primary_bg": "#f3f4f6", # Gray 100
+        "secondary_bg": "#ffffff", # White
+        "text_color": "#111827", # Gray 900
+        "accent_color": "#2563eb", # Blue 600
+        "success_color": "#059669", # Emerald 600
+        "warning_color": "#d97706", # Amber 600
+        "error_color": "#dc2626", # Red 600
+        "card_bg": "rgba(255, 255, 255, 0.95)",
+        "border_color": "rgba(0, 0, 0, 0.1)",
+        "shadow": "0 4px 6px -1px rgba(0, 0, 0, 0.1), 0 2px 4px -1px rgba(0, 0, 0, 0.06)",
+        "muted_text": "#4b5563",
+    },
+    "light": { # Classic
+        "primary_bg": "#f8fafc", # Slate 50
+        "secondary_bg": "#ffffff", # White
+        "text_color": "#0f172a", # Slate 900
+        "accent_color": "#4f46e5", # Indigo 600
+        "success_color": "#059669", # Emerald 600
+        "warning_color": "#d97706", # Amber 600
+        "error_color": "#dc2626", # Red 600
+        "card_bg": "rgba(255, 255, 255, 0.9)",
+        "border_color": "rgba(0, 0, 0, 0.08)",
+        "shadow": "0 10px 15px -3px rgba(0, 0, 0, 0.05)",
+        "muted_text": "#64748b",
+    },
+}
 
-    st.markdown(f"""
+_CSS_TEMPLATE = """
     <style>
         @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');
         @import url('https://fonts.googleapis.com/css2?family=JetBrains+Mono:wght@400;500&display=swap');
@@ -224,33 +227,24 @@ def load_css(theme="dark"):
         .campaign-expired {{ filter: grayscale(1); opacity: 0.6; }}
 
     </style>
-    """, unsafe_allow_html=True)
+    """
+
+@st.cache_data(show_spinner=False)
+def _build_css(theme):
+    # Unknown themes fall back to light (Classic), as before
+    return _CSS_TEMPLATE.format_map(_PALETTES.get(theme, _PALETTES["light"]))
+
+def load_css(theme="dark"):
+    st.markdown(_build_css(theme), unsafe_allow_html=True)
 
-def product_card_html(name, price, stock, category, currency_symbol="₹", image_data=None):
-    if stock < 5:
-        badge_class = "badge-danger"
-        stock_text = f"Low: {stock}"
-    else:
-        badge_class = "badge-success"
-        stock_text = f"Stock: {stock}"
-    
-    # Handle Image
-    if image_data:
-        try:
-            b64_img = base64.b64encode(image_data).decode('utf-8')
-            visual = f'<img src="data:image/png;base64,{b64_img}" class="product-img" />'
-        except:
-            visual = f'<div class="product-icon">📦</div>'
-    else:
-        icon_map = {
-            "Electronics": "💻", "Groceries": "🥦", "Beverages": "🥤",
-            "Fashion": "👕", "Stationery": "✏️", "Health": "💊",
-            "Snacks": "🍟", "Dairy": "🧀", "Bakery": "🥐", "Frozen": "🧊"
-        }
-        icon = icon_map.get(category, "📦")
-        visual = f'<div class="product-icon">{icon}</div>'
 
-    return f"""
+_ICON_MAP = {
+    "Electronics": "💻", "Groceries": "🥦", "Beverages": "🥤",
+    "Fashion": "👕", "Stationery": "✏️", "Health": "💊",
+    "Snacks": "🍟", "Dairy": "🧀", "Bakery": "🥐", "Frozen": "🧊"
+}
+
+_CARD_TEMPLATE = """
     <div class="product-card">
         <div>
             {visual}
@@ -263,3 +257,31 @@ def product_card_html(name, price, stock, category, currency_symbol="₹", image
         </div>
     </div>
     """
+
+def encode_image(image_data):
+    """Base64 text for a product image BLOB, or None when there is no usable image."""
+    if not image_data: return None
+    try:
+        return base64.b64encode(image_data).decode('utf-8')
+    except:
+        return None
+
+def product_card_html(name, price, stock, category, currency_symbol="₹", image_b64=None):
+    if stock < 5:
+        badge_class = "badge-danger"
+        stock_text = f"Low: {stock}"
+    else:
+        badge_class = "badge-success"
+        stock_text = f"Stock: {stock}"
+    
+    # Handle Image (already base64-encoded once per catalog load, see encode_image)
+    if image_b64:
+        visual = f'<img src="data:image/png;base64,{image_b64}" class="product-img" />'
+    else:
+        icon = _ICON_MAP.get(category, "📦")
+        visual = f'<div class="product-icon">{icon}</div>'
+
+    return _CARD_TEMPLATE.format(
+        visual=visual, category=category, name=name, currency_symbol=currency_symbol,
+        price=price, badge_class=badge_class, stock_text=stock_text
+    )
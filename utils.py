@@ -4,15 +4,20 @@ import math
 import random
 import pandas as pd
 import numpy as np
-import qrcode
 from io import BytesIO
-from fpdf import FPDF
 import urllib.parse
 from datetime import datetime, timedelta
-import shutil
+import sqlite3
 import os
-from PIL import Image
 import re
+import bisect
+from collections import defaultdict
+
+# Precompiled patterns for the login/signup validators (run on every rerun)
+_EMAIL_RE = re.compile(r'^[\w\.-]+@[\w\.-]+\.\w+$')
+_UPPER_RE = re.compile(r"[A-Z]")
+_LOWER_RE = re.compile(r"[a-z]")
+_DIGIT_OR_SPECIAL_RE = re.compile(r"[\d !@#$%^&*()_+\-=\[\]{};':\"\\|,.<>\/?]")
 
 # --- SYSTEM TIME HELPER ---
 def get_system_time():
@@ -27,9 +32,9 @@ def check_password_strength(password):
     """
     score = 0
     if len(password) >= 8: score += 1
-    if re.search(r"[A-Z]", password): score += 1
-    if re.search(r"[a-z]", password): score += 1
-    if re.search(r"\d", password) or re.search(r"[ !@#$%^&*()_+\-=\[\]{};':\"\\|,.<>\/?]", password): score += 1
+    if _UPPER_RE.search(password): score += 1
+    if _LOWER_RE.search(password): score += 1
+    if _DIGIT_OR_SPECIAL_RE.search(password): score += 1
     
     if score == 0: return 0, "Very Weak", "#ef4444"
     elif score == 1: return 1, "Weak", "#ef4444"
@@ -45,10 +50,17 @@ def validate_email(email):
     Returns True if valid or if email is empty (optional field), False otherwise.
     """
     if not email: return True # Optional field
-    pattern = r'^[\w\.-]+@[\w\.-]+\.\w+$'
-    return re.match(pattern, email) is not None
+    return _EMAIL_RE.match(email) is not None
 
 # --- MOBILE VALIDATION (COUNTRY SPECIFIC) ---
+# country code -> (min length, max length, length message, allowed first digits or None, first digit message)
+_MOBILE_RULES = {
+    "+91": (10, 10, "India (+91) numbers must be exactly 10 digits.", "6789", "India (+91) numbers must start with 6, 7, 8, or 9."), # India
+    "+971": (9, 9, "UAE (+971) numbers must be exactly 9 digits.", "5", "UAE (+971) numbers must start with 5."), # UAE
+    "+1": (10, 10, "USA (+1) numbers must be exactly 10 digits.", "23456789", "USA (+1) area code cannot start with 0 or 1."), # USA
+    "+44": (10, 11, "UK (+44) numbers must be 10-11 digits.", None, None), # UK
+}
+
 def validate_mobile_number(number_str, country_code):
     """
     Validates mobile number based on country specific rules.
@@ -59,27 +71,13 @@ def validate_mobile_number(number_str, country_code):
         
     clean_num = number_str.strip()
     
-    if country_code == "+91": # India
-        if len(clean_num) != 10:
-            return False, None, "India (+91) numbers must be exactly 10 digits."
-        if clean_num[0] not in ['6', '7', '8', '9']:
-            return False, None, "India (+91) numbers must start with 6, 7, 8, or 9."
-            
-    elif country_code == "+971": # UAE
-        if len(clean_num) != 9:
-            return False, None, "UAE (+971) numbers must be exactly 9 digits."
-        if not clean_num.startswith("5"):
-            return False, None, "UAE (+971) numbers must start with 5."
-            
-    elif country_code == "+1": # USA
-        if len(clean_num) != 10:
-            return False, None, "USA (+1) numbers must be exactly 10 digits."
-        if clean_num[0] in ['0', '1']:
-            return False, None, "USA (+1) area code cannot start with 0 or 1."
-            
-    elif country_code == "+44": # UK
-        if len(clean_num) < 10 or len(clean_num) > 11:
-             return False, None, "UK (+44) numbers must be 10-11 digits."
+    rule = _MOBILE_RULES.get(country_code)
+    if rule:
+        min_len, max_len, length_msg, valid_first, first_msg = rule
+        if not (min_len <= len(clean_num) <= max_len):
+            return False, None, length_msg
+        if valid_first and clean_num[0] not in valid_first:
+            return False, None, first_msg
 
     # E.164 Normalization
     normalized = f"{country_code}{clean_num}"
@@ -87,10 +85,14 @@ def validate_mobile_number(number_str, country_code):
 
 # --- HASHING HELPER ---
 def generate_hash(data_string):
+    """SHA-256 hex digest in a single hashlib call (OpenSSL-backed, no per-byte Python work)."""
+    # Must stay SHA-256: the result is compared against users.password_hash written by database.py
     return hashlib.sha256(data_string.encode()).hexdigest()
 
 # --- TRIE SEARCH ALGORITHM ---
 class TrieNode:
+    __slots__ = ('children', 'is_end_of_word', 'data')
+
     def __init__(self):
         self.children = {}
         self.is_end_of_word = False
@@ -115,19 +117,47 @@ class Trie:
             if char not in node.children:
                 return []
             node = node.children[char]
-        return self._collect_words(node)
+        return list(self._collect_words(node))
 
     def _collect_words(self, node):
-        results = []
-        if node.is_end_of_word:
-            results.append(node.data)
-        for child in node.children.values():
-            results.extend(self._collect_words(child))
-        return results
+        # Iterative pre-order walk; children are pushed reversed to keep insertion order
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.is_end_of_word:
+                yield node.data
+            stack.extend(reversed(node.children.values()))
+
+class PrefixIndex:
+    """
+    Static prefix index for catalogs that only change on admin actions.
+    Keys are kept sorted so a prefix lookup is two bisects and a slice
+    instead of a per-character walk over Python node objects.
+    """
+    def __init__(self, words, data):
+        self.records = {}
+        for word, item in zip(words, data):
+            self.records[word.lower()] = item
+        self.keys = sorted(self.records)
+
+    def search_prefix(self, prefix):
+        prefix = prefix.lower()
+        lo = bisect.bisect_left(self.keys, prefix)
+        hi = bisect.bisect_left(self.keys, prefix + chr(0x10FFFF), lo)
+        return [self.records[k] for k in self.keys[lo:hi]]
+
+def build_index(data_list, key):
+    """Case-insensitive key -> item map for repeated lookups; first match wins, as in linear_search."""
+    index = {}
+    for item in data_list:
+        index.setdefault(str(item.get(key)).casefold(), item)
+    return index
 
 def linear_search(data_list, key, value):
+    # One-shot lookup; build_index once when searching the same list repeatedly
+    target = str(value).casefold()
     for item in data_list:
-        if str(item.get(key)).lower() == str(value).lower():
+        if str(item.get(key)).casefold() == target:
             return item
     return None
 
@@ -147,40 +177,64 @@ def binary_search(sorted_list, key, value):
             return sorted_list[mid]
     return None
 
-def calculate_inventory_metrics(df_sales, df_products):
-    # Simplified metrics
-    if 'status' in df_sales.columns:
-        df_sales = df_sales[df_sales['status'] != 'Cancelled']
+def binary_search_batch(sorted_list, key, values, keys_array=None):
+    """
+    Looks up many values at once with np.searchsorted.
+    Pass keys_array (the sorted key column) to reuse it across calls.
+    Returns the matching item or None for each value.
+    """
+    if keys_array is None:
+        keys_array = np.asarray([item.get(key) for item in sorted_list])
+    if len(keys_array) == 0:
+        return [None] * len(values)
+    values = np.asarray(values)
+    idx = np.searchsorted(keys_array, values)
+    found = keys_array[idx.clip(max=len(keys_array) - 1)] == values
+    return [sorted_list[i] if m else None for i, m in zip(idx, found)]
 
-    metrics = []
-    for _, prod in df_products.iterrows():
-        annual_demand = prod['sales_count'] * 12 if prod['sales_count'] > 0 else 10 
-        
-        metrics.append({
-            "name": prod['name'],
-            "stock": prod['stock'],
-            "annual_demand_est": annual_demand,
-        })
-    return pd.DataFrame(metrics)
+def calculate_inventory_metrics(df_sales, df_products):
+    # Simplified metrics (demand is estimated from the products' own sales_count; df_sales is not consulted)
+    metrics = df_products[['name', 'stock']].reset_index(drop=True)
+    sales_count = df_products['sales_count'].to_numpy()
+    metrics['annual_demand_est'] = np.where(sales_count > 0, sales_count * 12, 10)
+    return metrics
 
 def forecast_next_period(sales_array, window=5):
+    sales_array = np.asarray(sales_array, dtype=np.float64)
     if len(sales_array) < window:
-        return np.mean(sales_array) if len(sales_array) > 0 else 0
+        return sales_array.mean() if len(sales_array) > 0 else 0
         
     recent = sales_array[-window:]
-    weights = np.arange(1, len(recent) + 1)
+    weights = np.arange(1, window + 1, dtype=np.float64)
     return np.dot(recent, weights) / weights.sum()
 
+def forecast_next_period_batch(sales_matrix, window=5):
+    """forecast_next_period for many series at once; one row per product, columns in time order."""
+    sales_matrix = np.atleast_2d(np.asarray(sales_matrix, dtype=np.float64))
+    if sales_matrix.shape[1] == 0:
+        return np.zeros(sales_matrix.shape[0])
+    if sales_matrix.shape[1] < window:
+        return sales_matrix.mean(axis=1)
+    
+    weights = np.arange(1, window + 1, dtype=np.float64)
+    return sales_matrix[:, -window:] @ weights / weights.sum()
+
 def analyze_trend_slope(sales_series):
     if len(sales_series) < 2: return "Stable"
-    x = np.arange(len(sales_series))
-    y = np.array(sales_series)
-    slope, _ = np.polyfit(x, y, 1)
+    # Closed-form least-squares slope for x = 0..n-1 (sum of squared deviations is n(n^2-1)/12)
+    y = np.asarray(sales_series, dtype=np.float64)
+    n = len(y)
+    slope = np.dot(np.arange(n) - (n - 1) / 2, y) / (n * (n * n - 1) / 12)
     
     if slope > 0.5: return "↗️ Increasing"
     elif slope < -0.5: return "↘️ Decreasing"
     else: return "➡️ Stable"
 
+def sold_item_ids(active_sales):
+    """Every sold product id (one entry per unit) from the comma-separated items_data column."""
+    ids = active_sales['items_data'].dropna().astype(str).str.split(',').explode().str.strip()
+    return pd.to_numeric(ids[ids != ''], errors='coerce').dropna().astype(np.int64)
+
 def rank_products(df_sales, df_products):
     if df_sales.empty: return pd.DataFrame()
     
@@ -189,39 +243,25 @@ def rank_products(df_sales, df_products):
     else:
         active_sales = df_sales
 
-    # Replaced JSON parsing with simple CSV string split
-    all_items = []
-    for _, row in active_sales.iterrows():
-        try:
-            # Check if we have data and it's not empty
-            if row['items_data']:
-                # Split the comma-separated string into IDs
-                ids = [int(x) for x in str(row['items_data']).split(',') if x.strip()]
-                all_items.extend(ids)
-        except: continue
-        
-    from collections import Counter
-    counts = Counter(all_items)
+    counts = sold_item_ids(active_sales).value_counts()
     
-    ranking_data = []
-    for _, prod in df_products.iterrows():
-        qty = counts.get(prod['id'], 0)
-        rev = qty * prod['price']
-        ranking_data.append({
-            "name": prod['name'],
-            "qty_sold": qty,
-            "revenue": rev,
-            "score": (qty * 10) + (rev * 0.01) 
-        })
-        
-    ranking_data.sort(key=lambda x: x['score'], reverse=True)
+    qty = df_products['id'].map(counts).fillna(0).astype(np.int64)
+    rev = qty * df_products['price']
+    df_rank = pd.DataFrame({
+        "name": df_products['name'],
+        "qty_sold": qty,
+        "revenue": rev,
+        "score": (qty * 10) + (rev * 0.01)
+    }).sort_values('score', ascending=False, kind='stable').reset_index(drop=True)
     
-    for i, item in enumerate(ranking_data):
-        if i == 0: item['rank'] = "🥇 Top Seller"
-        elif i < len(ranking_data)/2: item['rank'] = "🥈 Average Performer"
-        else: item['rank'] = "🥉 Low Performer"
+    pos = np.arange(len(df_rank))
+    df_rank['rank'] = np.select(
+        [pos == 0, pos < len(df_rank) / 2],
+        ["🥇 Top Seller", "🥈 Average Performer"],
+        default="🥉 Low Performer"
+    )
         
-    return pd.DataFrame(ranking_data)
+    return df_rank
 
 def get_product_performance_lists(df_sales, df_products):
     if df_sales.empty: return [], [], []
@@ -256,50 +296,25 @@ def calculate_profit_loss(df_sales, df_products):
 
 
 
-    prod_map = df_products.set_index('id')[['name', 'category', 'cost_price', 'price']].to_dict('index')
+    # One row per sold unit, priced by joining against the catalog (unknown ids drop out)
+    sold = sold_item_ids(active_sales).to_frame('pid').merge(
+        df_products[['id', 'category', 'price', 'cost_price']], left_on='pid', right_on='id', how='inner'
+    )
+    gross_rev = float(sold['price'].sum()) # Gross is sum of list prices
+    total_cost = float(sold['cost_price'].sum())
+    marketing_expense = 0
     
-    category_pl = {}
-    gross_rev = 0
-    total_cost = 0
-
-    for _, row in active_sales.iterrows():
-        try:
-            if row['items_data']:
-                items = [int(x) for x in str(row['items_data']).split(',') if x.strip()]
-                for pid in items:
-                    if pid in prod_map:
-                        p = prod_map[pid]
-                        cp = p['cost_price']
-                        sp = p['price']
-                        
-                        gross_rev += sp # Gross is sum of list prices
-                        total_cost += cp
-                        
-                        # Category breakdown
-                        profit_gross = sp - cp
-                        
-                        cat = p['category']
-                        if cat not in category_pl:
-                            category_pl[cat] = {'revenue': 0, 'cost': 0, 'profit': 0}
-                        category_pl[cat]['revenue'] += sp
-                        category_pl[cat]['cost'] += cp
-                        category_pl[cat]['profit'] += profit_gross
-                    
-        except: continue
+    # Category breakdown
+    df_pl = (sold.groupby('category', sort=False, dropna=False)
+                 .agg(Revenue=('price', 'sum'), Cost=('cost_price', 'sum'))
+                 .reset_index()
+                 .rename(columns={'category': 'Category'}))
+    df_pl['Profit'] = df_pl['Revenue'] - df_pl['Cost']
+    df_pl['Margin %'] = (df_pl['Profit'] / df_pl['Revenue'].where(df_pl['Revenue'] > 0) * 100).fillna(0)
 
     net_revenue = gross_rev 
     net_profit = net_revenue - total_cost
     
-    pl_data = []
-    for cat, metrics in category_pl.items():
-        pl_data.append({
-            "Category": cat,
-            "Revenue": metrics['revenue'],
-            "Cost": metrics['cost'],
-            "Profit": metrics['profit'], 
-            "Margin %": (metrics['profit'] / metrics['revenue'] * 100) if metrics['revenue'] > 0 else 0
-        })
-    
     return {
         "net_profit": net_profit, 
         "total_revenue": gross_rev, 
@@ -307,62 +322,54 @@ def calculate_profit_loss(df_sales, df_products):
         "total_cost": total_cost,
         "marketing_expense": marketing_expense,
         "margin_percent": (net_profit / net_revenue * 100) if net_revenue > 0 else 0
-    }, pd.DataFrame(pl_data)
+    }, df_pl
 
 def backup_system():
     if not os.path.exists("backups"): os.makedirs("backups")
     fname = f"backups/inventory_backup_{int(time.time())}.db"
+    if not os.path.exists("inventory_system.db"): return None
     try:
-        shutil.copy("inventory_system.db", fname)
+        # SQLite online backup: consistent snapshot even while pooled connections hold the DB open
+        src = sqlite3.connect("inventory_system.db")
+        dst = sqlite3.connect(fname)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
         return fname
     except Exception as e:
+        if os.path.exists(fname): os.remove(fname)
         return None
 
-class PDFReceipt(FPDF):
-    def __init__(self, store_name):
-        super().__init__()
-        self.store_name = store_name
-        # Logo logic removed
-
-    def header(self):
-        # Header Logo logic removed
-        self.set_font('Arial', 'B', 15)
-        self.cell(0, 10, self.store_name, 0, 1, 'C')
-        self.set_font('Arial', '', 9)
-        self.cell(0, 5, 'Professional Retail Invoice', 0, 1, 'C')
-        self.ln(5)
-
-    def footer(self):
-        self.set_y(-15)
-        self.set_font('Arial', 'I', 8)
-        self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
+# Core PDF fonts are Latin-1 only; the rupee sign is spelled out, anything else unmappable becomes '?'
+_PDF_TEXT_TABLE = str.maketrans({"₹": "Rs. "})
+
+def _pdf_text(text):
+    if not text: return ""
+    return str(text).translate(_PDF_TEXT_TABLE).encode('latin-1', 'replace').decode('latin-1')
 
 def generate_receipt_pdf(store_name, txn_id, time_str, items, total, operator, mode, pos, customer=None, tax_info=None, new_coupon=None):
     # Removed Logo Path Logic
     
+    from receipts import PDFReceipt # Deferred: fpdf is only needed once a receipt is printed
     pdf = PDFReceipt(store_name)
     pdf.add_page()
     
     pdf.set_font("Arial", size=10)
     
-    def clean_text(text):
-        if not text: return ""
-        text = str(text)
-        text = text.replace("₹", "Rs. ")
-        return text.encode('latin-1', 'replace').decode('latin-1')
-
-    pdf.cell(100, 6, clean_text(f"Order No: #{txn_id}"), 0, 0)
-    pdf.cell(0, 6, clean_text(f"Date: {time_str}"), 0, 1, 'R')
-    pdf.cell(100, 6, clean_text(f"Cashier: {operator}"), 0, 1, 'L')
+    pdf.cell(100, 6, _pdf_text(f"Order No: #{txn_id}"), 0, 0)
+    pdf.cell(0, 6, _pdf_text(f"Date: {time_str}"), 0, 1, 'R')
+    pdf.cell(100, 6, _pdf_text(f"Cashier: {operator}"), 0, 1, 'L')
     
     if customer:
         pdf.ln(5)
         pdf.set_font("Arial", 'B', 10)
         pdf.cell(0, 6, "Customer Details:", 0, 1, 'L')
         pdf.set_font("Arial", '', 10)
-        pdf.cell(0, 5, clean_text(f"Name: {customer.get('name', 'N/A')}"), 0, 1)
-        pdf.cell(0, 5, clean_text(f"Email: {customer.get('email', 'N/A')}"), 0, 1)
-        pdf.cell(0, 5, clean_text(f"Mobile: {customer.get('mobile', 'N/A')}"), 0, 1)
+        pdf.cell(0, 5, _pdf_text(f"Name: {customer.get('name', 'N/A')}"), 0, 1)
+        pdf.cell(0, 5, _pdf_text(f"Email: {customer.get('email', 'N/A')}"), 0, 1)
+        pdf.cell(0, 5, _pdf_text(f"Mobile: {customer.get('mobile', 'N/A')}"), 0, 1)
 
     pdf.ln(5)
     
@@ -374,16 +381,15 @@ def generate_receipt_pdf(store_name, txn_id, time_str, items, total, operator, m
     pdf.cell(40, 8, "Total", 1, 1, 'R', True)
     
     pdf.set_font("Arial", '', 10)
-    item_summary = {}
+    item_summary = defaultdict(lambda: {'price': 0, 'qty': 0, 'total': 0})
     for i in items:
-        if i['name'] in item_summary:
-            item_summary[i['name']]['qty'] += 1
-            item_summary[i['name']]['total'] += i['price']
-        else:
-            item_summary[i['name']] = {'price': i['price'], 'qty': 1, 'total': i['price']}
+        line = item_summary[i['name']]
+        if not line['qty']: line['price'] = i['price'] # Unit price of the first occurrence
+        line['qty'] += 1
+        line['total'] += i['price']
             
     for name, data in item_summary.items():
-        pdf.cell(100, 7, clean_text(name), 1)
+        pdf.cell(100, 7, _pdf_text(name), 1)
         pdf.cell(30, 7, f"{data['price']:.2f}", 1, 0, 'C')
         pdf.cell(20, 7, str(data['qty']), 1, 0, 'C')
         pdf.cell(40, 7, f"{data['total']:.2f}", 1, 1, 'R')
@@ -397,11 +403,11 @@ def generate_receipt_pdf(store_name, txn_id, time_str, items, total, operator, m
 
     pdf.set_font("Arial", 'B', 12)
     pdf.cell(150, 8, "NET TOTAL", 0, 0, 'R')
-    pdf.cell(40, 8, clean_text(f"Rs. {total:.2f}"), 1, 1, 'R')
+    pdf.cell(40, 8, _pdf_text(f"Rs. {total:.2f}"), 1, 1, 'R')
     
     pdf.set_font("Arial", '', 9)
     pdf.ln(10)
-    pdf.cell(0, 5, clean_text(f"Payment Mode: {mode}"), 0, 1, 'L')
+    pdf.cell(0, 5, _pdf_text(f"Payment Mode: {mode}"), 0, 1, 'L')
     pdf.cell(0, 5, "Terms: Non-refundable. Goods once sold cannot be returned.", 0, 1, 'C')
     
     return pdf.output(dest='S').encode('latin-1')
@@ -420,7 +426,9 @@ def generate_upi_qr(vpa, name, amount, note):
         "orgid": "000000" 
     }
     url = f"upi://pay?{urllib.parse.urlencode(params)}"
-    qr = qrcode.QRCode(box_size=10, border=4)
+    import qrcode # Deferred: pure-Python encoder, only needed at checkout
+    # Shown on-screen only, so the lowest error correction level is enough and gives a smaller matrix
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=10, border=4)
     qr.add_data(url)
     qr.make(fit=True)
     img = qr.make_image(fill_color="black", back_color="white")
@@ -428,8 +436,12 @@ def generate_upi_qr(vpa, name, amount, note):
     img.save(buf)
     return buf.getvalue()
 
+# ASCII digit -> Luhn contribution, for plain and doubled positions
+_LUHN_PLAIN = bytes.maketrans(b"0123456789", bytes(range(10)))
+_LUHN_DOUBLED = bytes.maketrans(b"0123456789", bytes(2 * d - 9 if d > 4 else 2 * d for d in range(10)))
+
 def validate_card(number, expiry, cvv):
-    if not number.isdigit() or not (13 <= len(number) <= 19):
+    if not (number.isascii() and number.isdigit()) or not (13 <= len(number) <= 19):
         return False, "Invalid Card Number Length (13-19 digits required)"
     
     if not cvv.isdigit() or not (3 <= len(cvv) <= 4):
@@ -444,16 +456,9 @@ def validate_card(number, expiry, cvv):
     except:
         return False, "Invalid Expiry Date"
 
-    digits = [int(d) for d in number]
-    checksum = digits.pop()
-    digits.reverse()
-    doubled = []
-    for i, d in enumerate(digits):
-        if i % 2 == 0:
-            d *= 2
-            if d > 9: d -= 9
-        doubled.append(d)
-    total = sum(doubled) + checksum
+    # Luhn: read right to left, check digit kept as-is, every second digit doubled (minus 9 if > 9)
+    rev = number.encode('ascii')[::-1]
+    total = sum(rev[0::2].translate(_LUHN_PLAIN)) + sum(rev[1::2].translate(_LUHN_DOUBLED))
     
     if total % 10 == 0:
         return True, "Valid"